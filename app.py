@@ -5,20 +5,35 @@ Provides a user-friendly interface for the entire pipeline.
 """
 
 import os
-import sys
+import base64
+import fcntl
 import json
+import importlib.util
 import pathlib
-import subprocess
 import logging
+import queue
+import re
+import shutil
+import sys
+import time
+import uuid
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from functools import lru_cache
 from typing import Dict, List, Optional
 
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for, flash
+from flask import (Flask, Response, render_template, request, jsonify, send_file, redirect,
+                   url_for, flash, abort, stream_with_context)
 from werkzeug.utils import secure_filename
-import threading
 
-# Import enhanced TTS functionality
-from tts_enhanced import model_manager, voice_cloner, tts_engine
+MODELS_FOLDER = 'models'
+
+# Keep the Hugging Face cache on the models volume so downloads survive
+# restarts. These must be set before huggingface_hub is imported (see get_tts).
+os.environ.setdefault('HF_HOME', os.path.abspath(f'{MODELS_FOLDER}/hf'))
+os.environ.setdefault('HF_HUB_CACHE', os.path.join(os.environ['HF_HOME'], 'hub'))
+if importlib.util.find_spec('hf_transfer') is not None:
+    os.environ.setdefault('HF_HUB_ENABLE_HF_TRANSFER', '1')
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
@@ -31,43 +46,96 @@ app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key-change-in-producti
 UPLOAD_FOLDER = 'data/input'
 WORK_FOLDER = 'data/work'
 OUTPUT_FOLDER = 'data/output'
-MODELS_FOLDER = 'models'
 ALLOWED_EXTENSIONS = {'epub'}
 
 app.config['UPLOAD_FOLDER'] = UPLOAD_FOLDER
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
+UPLOAD_CHUNK_SIZE = 1024 * 1024  # Copy uploads to disk 1MB at a time
+PARTIAL_FOLDER = os.path.join(UPLOAD_FOLDER, '.partial')  # In-progress resumable uploads
+TUS_VERSION = '1.0.0'
+PARTIAL_TTL = 24 * 3600  # seconds before an untouched partial upload is discarded
+SSE_MAX_STREAM = 300  # seconds before an event stream is closed (EventSource reconnects)
+
+# Background jobs. TTS is GPU-bound, so conversions run one at a time;
+# downloads and voice cloning share a separate pool.
+TTS_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix='tts')
+CPU_POOL = ThreadPoolExecutor(max_workers=os.cpu_count(), thread_name_prefix='cpu')
+JOBS: Dict[str, Future] = {}
+JOB_PROGRESS: Dict[str, Dict] = {}
+JOB_FINISHED: Dict[str, float] = {}  # job id -> time.monotonic() when it finished
+JOB_RETENTION = 3600  # seconds a finished job stays queryable
 
 # Ensure directories exist
-for folder in [UPLOAD_FOLDER, WORK_FOLDER, OUTPUT_FOLDER, MODELS_FOLDER]:
+for folder in [UPLOAD_FOLDER, PARTIAL_FOLDER, WORK_FOLDER, OUTPUT_FOLDER, MODELS_FOLDER]:
     pathlib.Path(folder).mkdir(parents=True, exist_ok=True)
 
+@lru_cache(maxsize=1)
+def get_tts():
+    """Import the enhanced TTS module on first use, keeping it off the dashboard path"""
+    import tts_enhanced
+    return tts_enhanced
+
 def allowed_file(filename):
     return '.' in filename and filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
+def is_within(path, base):
+    """Check that a resolved path lies inside the resolved base directory"""
+    base = str(pathlib.Path(base).resolve())
+    return os.path.commonpath([str(pathlib.Path(path).resolve()), base]) == base
+
+def safe_join(base, name):
+    """Join a user-supplied file name onto base, or None if it is empty or escapes base"""
+    filename = secure_filename(name or '')
+    if not filename:
+        return None
+    full = pathlib.Path(base).resolve() / filename
+    if not is_within(full, base):
+        return None
+    return full
+
+def detect_gpu():
+    """Check for an NVIDIA GPU without shelling out to nvidia-smi"""
+    try:
+        import pynvml
+        pynvml.nvmlInit()
+        pynvml.nvmlShutdown()
+        return True
+    except ImportError:
+        # The kernel driver exposes this file whenever a GPU is usable
+        return pathlib.Path('/proc/driver/nvidia/version').exists()
+    except Exception:
+        return False
+
+def count_dir(path):
+    """Count the entries in a directory, or 0 if it does not exist"""
+    try:
+        with os.scandir(path) as it:
+            return sum(1 for _ in it)
+    except FileNotFoundError:
+        return 0
+
+STATUS_TTL = 5  # seconds
+_status_cache = {'time': 0.0, 'value': None}
+
 def get_system_status():
-    """Get current system status"""
+    """Get current system status, cached for STATUS_TTL seconds"""
+    now = time.monotonic()
+    if _status_cache['value'] is not None and now - _status_cache['time'] < STATUS_TTL:
+        return _status_cache['value']
+    
     status = {
-        'gpu_available': False,
+        'gpu_available': detect_gpu(),
         'models_installed': {},
         'recent_jobs': []
     }
     
-    # Check GPU availability
-    try:
-        result = subprocess.run(['nvidia-smi'], capture_output=True, text=True)
-        status['gpu_available'] = result.returncode == 0
-    except:
-        status['gpu_available'] = False
-    
     # Check installed models
-    studio_models = list(pathlib.Path(f'{MODELS_FOLDER}/studio').glob('*')) if pathlib.Path(f'{MODELS_FOLDER}/studio').exists() else []
-    fast_models = list(pathlib.Path(f'{MODELS_FOLDER}/fast').glob('*')) if pathlib.Path(f'{MODELS_FOLDER}/fast').exists() else []
-    
     status['models_installed'] = {
-        'studio': len(studio_models),
-        'fast': len(fast_models)
+        'studio': count_dir(f'{MODELS_FOLDER}/studio'),
+        'fast': count_dir(f'{MODELS_FOLDER}/fast')
     }
     
+    _status_cache.update(time=now, value=status)
     return status
 
 @app.route('/')
@@ -92,7 +160,8 @@ def upload_file():
         if file and allowed_file(file.filename):
             filename = secure_filename(file.filename)
             filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
-            file.save(filepath)
+            with open(filepath, 'wb') as f:
+                shutil.copyfileobj(file.stream, f, UPLOAD_CHUNK_SIZE)
             flash(f'File {filename} uploaded successfully!', 'success')
             return redirect(url_for('process_book', filename=filename))
         else:
@@ -100,10 +169,168 @@ def upload_file():
     
     return render_template('upload.html')
 
+@app.route('/upload-stream', methods=['POST'])
+def upload_stream():
+    """Handle a raw EPUB request body, streamed straight to disk"""
+    filename = request.headers.get('X-Filename') or request.args.get('filename', '')
+    if not filename or not allowed_file(filename):
+        return jsonify({'error': 'A filename ending in .epub is required'}), 400
+    
+    filename = secure_filename(filename)
+    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    try:
+        with open(filepath, 'wb') as f:
+            shutil.copyfileobj(request.stream, f, UPLOAD_CHUNK_SIZE)
+    except Exception:
+        # Don't leave a truncated EPUB behind (e.g. when the size limit is hit)
+        pathlib.Path(filepath).unlink(missing_ok=True)
+        raise
+    
+    return jsonify({
+        'filename': filename,
+        'status': 'uploaded',
+        'message': f'File {filename} uploaded successfully'
+    })
+
+def tus_response(status=204, headers=None):
+    """Empty response carrying the tus protocol version header"""
+    response = Response(status=status)
+    response.headers['Tus-Resumable'] = TUS_VERSION
+    response.headers.update(headers or {})
+    return response
+
+def parse_upload_metadata(header):
+    """Decode a tus Upload-Metadata header ("key base64value,key2 ...")"""
+    metadata = {}
+    for pair in filter(None, (item.strip() for item in header.split(','))):
+        key, _, value = pair.partition(' ')
+        metadata[key] = base64.b64decode(value, validate=True).decode('utf-8') if value else ''
+    return metadata
+
+def partial_upload_paths(upload_id):
+    """Data and info file paths for an in-progress upload, aborting with 404 if unknown"""
+    if not re.fullmatch(r'[0-9a-f]{32}', upload_id):
+        abort(404)
+    data_path = pathlib.Path(PARTIAL_FOLDER) / upload_id
+    info_path = data_path.with_suffix('.json')
+    if not info_path.exists():
+        abort(404)
+    return data_path, info_path
+
+def expire_partial_uploads():
+    """Delete partial uploads that have not received data for PARTIAL_TTL seconds"""
+    cutoff = time.time() - PARTIAL_TTL
+    for path in pathlib.Path(PARTIAL_FOLDER).iterdir():
+        try:
+            if path.stat().st_mtime < cutoff:
+                path.unlink()
+        except FileNotFoundError:
+            pass
+
+@app.before_request
+def check_tus_version():
+    """Reject tus requests from clients speaking another protocol version"""
+    if (request.endpoint in ('tus_create_upload', 'tus_upload')
+            and request.method != 'OPTIONS'
+            and request.headers.get('Tus-Resumable') != TUS_VERSION):
+        return tus_response(412, {'Tus-Version': TUS_VERSION})
+
+@app.route('/files', methods=['OPTIONS', 'POST'])
+def tus_create_upload():
+    """Resumable upload (tus protocol): describe the server or create a new upload"""
+    if request.method == 'OPTIONS':
+        return tus_response(204, {
+            'Tus-Version': TUS_VERSION,
+            'Tus-Extension': 'creation',
+            'Tus-Max-Size': str(app.config['MAX_CONTENT_LENGTH'])
+        })
+    
+    try:
+        length = int(request.headers['Upload-Length'])
+        metadata = parse_upload_metadata(request.headers.get('Upload-Metadata', ''))
+    except (KeyError, ValueError):
+        return tus_response(400)
+    
+    if length < 0:
+        return tus_response(400)
+    if length > app.config['MAX_CONTENT_LENGTH']:
+        return tus_response(413)
+    
+    filename = metadata.get('filename', '')
+    if not allowed_file(filename) or not secure_filename(filename):
+        return tus_response(400)
+    
+    expire_partial_uploads()
+    upload_id = uuid.uuid4().hex
+    data_path = pathlib.Path(PARTIAL_FOLDER) / upload_id
+    data_path.touch()
+    data_path.with_suffix('.json').write_text(
+        json.dumps({'filename': filename, 'length': length}), encoding='utf-8'
+    )
+    
+    return tus_response(201, {'Location': url_for('tus_upload', upload_id=upload_id)})
+
+@app.route('/files/<upload_id>', methods=['HEAD', 'PATCH'])
+def tus_upload(upload_id):
+    """Resumable upload (tus protocol): report the current offset or append a chunk"""
+    data_path, info_path = partial_upload_paths(upload_id)
+    try:
+        info = json.loads(info_path.read_text(encoding='utf-8'))
+        offset = data_path.stat().st_size
+    except FileNotFoundError:
+        abort(404)  # Completed or expired since the lookup
+    
+    if request.method == 'HEAD':
+        return tus_response(200, {
+            'Upload-Offset': str(offset),
+            'Upload-Length': str(info['length']),
+            'Cache-Control': 'no-store'
+        })
+    
+    if request.content_type != 'application/offset+octet-stream':
+        return tus_response(415)
+    
+    # Hold an exclusive lock from the offset check to the end of the append so
+    # two PATCH requests for the same upload cannot interleave their bytes.
+    with open(data_path, 'ab') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            return tus_response(423)
+        if not info_path.exists():
+            return tus_response(404)  # Completed or expired while we waited
+        offset = os.fstat(f.fileno()).st_size
+        if request.headers.get('Upload-Offset') != str(offset):
+            return tus_response(409)
+        
+        # Append the body without reading past the declared upload length. Bytes
+        # written before a dropped connection stay on disk for the client to resume.
+        remaining = info['length'] - offset
+        while remaining > 0:
+            block = request.stream.read(min(UPLOAD_CHUNK_SIZE, remaining))
+            if not block:
+                break
+            f.write(block)
+            remaining -= len(block)
+        offset = f.tell()
+        
+        headers = {'Upload-Offset': str(offset)}
+        if offset == info['length']:
+            filepath = safe_join(app.config['UPLOAD_FOLDER'], info['filename'])
+            if filepath is None:
+                return tus_response(400)
+            os.replace(data_path, filepath)
+            info_path.unlink()
+            headers['X-Filename'] = filepath.name
+    
+    return tus_response(204, headers)
+
 @app.route('/process/<filename>')
 def process_book(filename):
     """Book processing interface"""
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    filepath = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if filepath is None:
+        abort(400)
     if not os.path.exists(filepath):
         flash('File not found', 'error')
         return redirect(url_for('index'))
@@ -120,13 +347,13 @@ def process_book(filename):
 @app.route('/api/models')
 def get_available_models():
     """Get list of available TTS models"""
-    installed = model_manager.list_installed_models()
+    installed = get_tts().model_manager.list_installed_models()
     return jsonify(installed)
 
 @app.route('/api/voices')
 def get_available_voices():
     """Get list of available voices"""
-    voices = tts_engine.get_available_voices()
+    voices = get_tts().tts_engine.get_available_voices()
     return jsonify(voices)
 
 @app.route('/api/convert', methods=['POST'])
@@ -140,12 +367,14 @@ def start_conversion():
     if not filename:
         return jsonify({'error': 'No filename provided'}), 400
     
-    filepath = os.path.join(app.config['UPLOAD_FOLDER'], filename)
+    filepath = safe_join(app.config['UPLOAD_FOLDER'], filename)
+    if filepath is None:
+        return jsonify({'error': 'Invalid filename'}), 400
     if not os.path.exists(filepath):
         return jsonify({'error': 'File not found'}), 404
     
     # Start conversion in background thread
-    job_id = start_conversion_job(filepath, settings)
+    job_id = start_conversion_job(str(filepath), settings)
     
     return jsonify({
         'job_id': job_id,
@@ -153,22 +382,69 @@ def start_conversion():
         'message': 'Conversion started successfully'
     })
 
+def job_status(job_id):
+    """Build the status payload for a background job, or None if it is unknown"""
+    future = JOBS.get(job_id)
+    if future is None:
+        return None
+    
+    error = None
+    if future.running():
+        status = 'running'
+    elif not future.done():
+        status = 'queued'
+    elif future.exception() is not None:
+        status = 'failed'
+        error = str(future.exception())
+    else:
+        status = 'completed'
+    
+    return {
+        'job_id': job_id,
+        'status': status,
+        'error': error,
+        **JOB_PROGRESS.get(job_id, {})
+    }
+
 @app.route('/api/jobs/<job_id>/status')
 def get_job_status(job_id):
-    """Get status of a conversion job"""
-    # In a real implementation, this would check job status from a queue/database
-    # For now, return a placeholder response
-    return jsonify({
-        'job_id': job_id,
-        'status': 'running',
-        'progress': 45,
-        'current_step': 'Generating TTS audio',
-        'estimated_time_remaining': '15 minutes'
-    })
+    """Get status of a background job"""
+    status = job_status(job_id)
+    if status is None:
+        return jsonify({'error': 'Job not found'}), 404
+    return jsonify(status)
+
+@app.route('/api/jobs/<job_id>/events')
+def stream_job_status(job_id):
+    """Stream job status as server-sent events until the job finishes"""
+    if job_id not in JOBS:
+        return jsonify({'error': 'Job not found'}), 404
+    
+    def events():
+        last = None
+        deadline = time.monotonic() + SSE_MAX_STREAM
+        while time.monotonic() < deadline:
+            status = job_status(job_id)
+            if status is None:
+                return  # Evicted after finishing
+            if status != last:
+                yield f"data: {json.dumps(status)}\n\n"
+                last = status
+            else:
+                # Comment line: lets a closed tab surface as a write error so
+                # the worker thread is freed instead of waiting for a change
+                yield ": keepalive\n\n"
+            if status['status'] in ('completed', 'failed'):
+                return
+            time.sleep(1)
+    
+    return Response(stream_with_context(events()), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache'})
 
 @app.route('/models')
 def model_management():
     """Model management interface"""
+    model_manager = get_tts().model_manager
     installed_models = model_manager.list_installed_models()
     available_models = model_manager.list_available_models()
     
@@ -223,10 +499,16 @@ def create_voice_clone():
     if audio_file.filename == '':
         return jsonify({'error': 'No file selected'}), 400
     
+    # Voice names become directory names, so keep them to a single path component
+    if not secure_filename(voice_name) or any(sep in voice_name for sep in ('/', '\\', '..')):
+        return jsonify({'error': 'Invalid voice name'}), 400
+    
     # Save the audio file
-    filename = secure_filename(audio_file.filename)
-    audio_path = os.path.join('data/voice_samples', filename)
     pathlib.Path('data/voice_samples').mkdir(parents=True, exist_ok=True)
+    audio_path = safe_join('data/voice_samples', audio_file.filename)
+    if audio_path is None:
+        return jsonify({'error': 'Invalid filename'}), 400
+    audio_path = str(audio_path)
     audio_file.save(audio_path)
     
     # Start voice cloning process
@@ -238,15 +520,33 @@ def create_voice_clone():
         'message': f'Started creating voice clone: {voice_name}'
     })
 
+FOLDER_SIZE_TTL = 30  # seconds
+_folder_size_cache: Dict[str, tuple] = {}
+
 def get_folder_size(folder_path):
-    """Get the size of a folder in MB"""
+    """Get the size of a folder in MB, cached per folder for FOLDER_SIZE_TTL seconds"""
+    folder_path = os.path.abspath(folder_path)
+    now = time.monotonic()
+    cached = _folder_size_cache.get(folder_path)
+    if cached is not None and now - cached[0] < FOLDER_SIZE_TTL:
+        return cached[1]
+    
     total_size = 0
-    for dirpath, dirnames, filenames in os.walk(folder_path):
-        for f in filenames:
-            fp = os.path.join(dirpath, f)
-            if os.path.exists(fp):
-                total_size += os.path.getsize(fp)
-    return round(total_size / (1024 * 1024), 2)  # Convert to MB
+    stack = [folder_path]
+    while stack:
+        try:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    # Symlinks are not followed, so the walk never leaves folder_path
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total_size += entry.stat(follow_symlinks=False).st_size
+        except FileNotFoundError:
+            continue
+    size_mb = round(total_size / (1024 * 1024), 2)  # Convert to MB
+    _folder_size_cache[folder_path] = (now, size_mb)
+    return size_mb
 
 def get_popular_hf_models():
     """Get list of popular TTS models from Hugging Face"""
@@ -272,103 +572,164 @@ def get_popular_hf_models():
         }
     ]
 
+def run_pipeline_step(step, argv=None, **hooks):
+    """Run a pipeline script's main() in-process, raising if it exits with an error"""
+    try:
+        step.main(argv or [], **hooks)
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            raise RuntimeError(f"{step.__name__} exited with status {e.code}")
+
+def new_job_id(prefix):
+    """Create a unique job id"""
+    return f"{prefix}_{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+
+def evict_finished_jobs():
+    """Forget jobs that finished more than JOB_RETENTION seconds ago"""
+    cutoff = time.monotonic() - JOB_RETENTION
+    for job_id, finished in list(JOB_FINISHED.items()):
+        if finished < cutoff:
+            JOB_FINISHED.pop(job_id, None)
+            JOBS.pop(job_id, None)
+            JOB_PROGRESS.pop(job_id, None)
+
+def submit_job(pool, job_id, fn):
+    """Run fn on a worker pool and register its Future under job_id"""
+    evict_finished_jobs()
+    JOB_PROGRESS[job_id] = {}
+    
+    def mark_finished(_):
+        JOB_FINISHED[job_id] = time.monotonic()
+    
+    JOBS[job_id] = pool.submit(fn)
+    JOBS[job_id].add_done_callback(mark_finished)
+    return job_id
+
+def iter_queue(q):
+    """Yield items from a queue until the None sentinel arrives"""
+    while (item := q.get()) is not None:
+        yield item
+
+def run_streaming_steps(tier, voice):
+    """Chunk, synthesize and master concurrently, handing items over queues.
+    
+    Chunks go to TTS as soon as they are written and each WAV is mastered
+    while the next one is being synthesized, so wall time tracks the slowest
+    stage (TTS) rather than the sum of all three. Items are just file paths,
+    so the queues are left unbounded and producers never block.
+    """
+    from scripts import clean_and_chunk, tts_generate, master_audio
+    
+    chunk_queue, wav_queue = queue.Queue(), queue.Queue()
+    
+    def chunk():
+        try:
+            run_pipeline_step(clean_and_chunk, on_chunk=chunk_queue.put)
+        finally:
+            chunk_queue.put(None)
+    
+    def master():
+        run_pipeline_step(master_audio, wavs=iter_queue(wav_queue))
+    
+    with ThreadPoolExecutor(max_workers=2, thread_name_prefix='stage') as stages:
+        chunking = stages.submit(chunk)
+        mastering = stages.submit(master)
+        try:
+            # Models stay loaded between jobs
+            run_pipeline_step(tts_generate, ['--tier', tier, '--voice', voice],
+                              items=iter_queue(chunk_queue), on_wav=wav_queue.put)
+        finally:
+            wav_queue.put(None)
+        chunking.result()
+        mastering.result()
+
 def start_conversion_job(filepath, settings):
-    """Start conversion job in background thread"""
-    job_id = f"job_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    """Queue a conversion job on the TTS worker"""
+    job_id = new_job_id('job')
     
     def run_conversion():
+        # Pipeline steps run in-process so imports and loaded models are shared;
+        # they are imported on first use to keep them off the app's startup path
+        from scripts import epub_to_md, package_m4b
+        
         try:
             # Run the conversion pipeline
             tier = settings.get('tier', 'fast')
             voice = settings.get('voice', 'en_female_01')
             
-            # Convert EPUB to markdown
-            subprocess.run([
-                sys.executable, 'scripts/epub_to_md.py', filepath
-            ], check=True)
-            
-            # Clean and chunk
-            subprocess.run([
-                sys.executable, 'scripts/clean_and_chunk.py'
-            ], check=True)
-            
-            # Generate TTS
-            subprocess.run([
-                sys.executable, 'scripts/tts_generate.py',
-                '--tier', tier,
-                '--voice', voice
-            ], check=True)
-            
-            # Master audio
-            subprocess.run([
-                sys.executable, 'scripts/master_audio.py'
-            ], check=True)
-            
-            # Package
-            subprocess.run([
-                sys.executable, 'scripts/package_m4b.py'
-            ], check=True)
+            # (progress at start, description, step, arguments)
+            steps = [
+                (0, 'Converting EPUB to Markdown', run_pipeline_step, (epub_to_md, [filepath])),
+                (20, 'Chunking, generating and mastering audio', run_streaming_steps, (tier, voice)),
+                (80, 'Packaging audiobook', run_pipeline_step, (package_m4b,)),
+            ]
+            for progress, description, step, step_args in steps:
+                JOB_PROGRESS[job_id].update(progress=progress, current_step=description)
+                step(*step_args)
             
+            JOB_PROGRESS[job_id].update(progress=100, current_step='Complete')
             logger.info(f"Conversion job {job_id} completed successfully")
             
         except Exception as e:
             logger.error(f"Conversion job {job_id} failed: {e}")
+            raise
     
-    thread = threading.Thread(target=run_conversion)
-    thread.daemon = True
-    thread.start()
-    
-    return job_id
+    return submit_job(TTS_POOL, job_id, run_conversion)
 
 def start_model_download(model_name, model_type):
-    """Start model download in background thread"""
-    job_id = f"download_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    """Queue a model download"""
+    job_id = new_job_id('download')
     
     def download_model():
-        try:
-            def progress_callback(message):
-                logger.info(f"Download progress: {message}")
-            
-            success = model_manager.download_model(model_name, model_type, progress_callback)
-            if success:
-                logger.info(f"Model download job {job_id} completed successfully")
-            else:
-                logger.error(f"Model download job {job_id} failed")
-            
-        except Exception as e:
-            logger.error(f"Model download job {job_id} failed: {e}")
-    
-    thread = threading.Thread(target=download_model)
-    thread.daemon = True
-    thread.start()
+        def progress_callback(message):
+            logger.info(f"Download progress: {message}")
+            JOB_PROGRESS[job_id]['current_step'] = message
+        
+        if not get_tts().model_manager.download_model(model_name, model_type, progress_callback):
+            logger.error(f"Model download job {job_id} failed")
+            raise RuntimeError(f"Failed to download {model_name}")
+        logger.info(f"Model download job {job_id} completed successfully")
     
-    return job_id
+    return submit_job(CPU_POOL, job_id, download_model)
 
 def start_voice_cloning(audio_path, voice_name):
-    """Start voice cloning in background thread"""
-    job_id = f"clone_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    """Queue a voice cloning job"""
+    job_id = new_job_id('clone')
     
     def clone_voice():
-        try:
-            def progress_callback(message):
-                logger.info(f"Voice cloning progress: {message}")
-            
-            success = voice_cloner.create_voice_clone(
-                audio_path, voice_name, progress_callback=progress_callback
-            )
-            if success:
-                logger.info(f"Voice cloning job {job_id} completed successfully")
-            else:
-                logger.error(f"Voice cloning job {job_id} failed")
-            
-        except Exception as e:
-            logger.error(f"Voice cloning job {job_id} failed: {e}")
-    
-    thread = threading.Thread(target=clone_voice)
-    thread.daemon = True
-    thread.start()
-    
-    return job_id
+        def progress_callback(message):
+            logger.info(f"Voice cloning progress: {message}")
+            JOB_PROGRESS[job_id]['current_step'] = message
+        
+        success = get_tts().voice_cloner.create_voice_clone(
+            audio_path, voice_name, progress_callback=progress_callback
+        )
+        if not success:
+            logger.error(f"Voice cloning job {job_id} failed")
+            # The last progress message carries the specific reason
+            reason = JOB_PROGRESS[job_id].get('current_step', '').removeprefix('Error: ')
+            raise RuntimeError(f"Failed to create voice clone {voice_name}: {reason}")
+        logger.info(f"Voice cloning job {job_id} completed successfully")
+    
+    return submit_job(CPU_POOL, job_id, clone_voice)
+
+def run_production_server(host, port):
+    """Serve the app with gunicorn, falling back to Flask's server if it is missing"""
+    try:
+        from gunicorn.app.wsgiapp import run
+    except ImportError:
+        logger.warning("gunicorn not installed, using Flask's development server")
+        app.run(host=host, port=port, threaded=True)
+        return
+    
+    # A single worker process keeps the job registry and worker pools shared
+    # between requests; threads give concurrent request handling.
+    threads = os.environ.get('WEB_THREADS', '8')
+    sys.argv = [
+        'gunicorn', '--worker-class', 'gthread', '--workers', '1',
+        '--threads', threads, '--bind', f'{host}:{port}', 'wsgi:app'
+    ]
+    run()
 
 if __name__ == '__main__':
     # Check if we're in development or production
@@ -376,4 +737,7 @@ if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5000))
     host = os.environ.get('HOST', '0.0.0.0')
     
-    app.run(host=host, port=port, debug=debug_mode)
\ No newline at end of file
+    if debug_mode:
+        app.run(host=host, port=port, debug=True)
+    else:
+        run_production_server(host, port)
@@ -4,7 +4,7 @@ Demonstration script for the epub2audiobook pipeline.
 Creates sample data and runs through the complete pipeline.
 """
 
-import os
+import importlib
 import sys
 import pathlib
 import tempfile
@@ -63,6 +63,18 @@ The case was closed by 3:30 PM that very day, much to the satisfaction of Scotla
     return md_file
 
 
+def run_step(name, argv):
+    """Run scripts/<name>.py in this interpreter, like running it from the shell."""
+    try:
+        step = importlib.import_module(f"scripts.{name}")
+        step.main(argv)
+    except ImportError as e:
+        print(f"⚠️  Could not run {name}: {e}")
+    except SystemExit as e:
+        if e.code not in (None, 0):
+            print(f"⚠️  {name} exited with status {e.code}")
+
+
 def main():
     print("🎧 EPUB to Audiobook Pipeline Demo")
     print("===================================")
@@ -77,7 +89,7 @@ def main():
     print(f"✅ Sample content created: {sample_file}")
     
     print("\n🧹 Step 1: Cleaning and chunking text...")
-    os.system(f"python scripts/clean_and_chunk.py --md {sample_file} --max_chars 800")
+    run_step("clean_and_chunk", ["--md", str(sample_file), "--max_chars", "800"])
     
     # Check if chunks were created
     chunks_dir = pathlib.Path("data/work/chunks")
@@ -93,7 +105,7 @@ def main():
             print(f"Content (first 200 chars): {first_chunk[:200]}...")
     
     print("\n🎤 Step 2: Generating TTS audio (placeholder)...")
-    os.system("python scripts/tts_generate.py --tier fast")
+    run_step("tts_generate", ["--tier", "fast"])
     
     # Check if audio was generated
     wavs_dir = pathlib.Path("data/work/wavs")
@@ -0,0 +1,3 @@
+"""
+Pipeline step scripts, runnable standalone or importable from the web app.
+"""
@@ -9,56 +9,90 @@ import pathlib
 import json
 import yaml
 import sys
+from concurrent.futures import ThreadPoolExecutor
 from textwrap import dedent
 
 
+# Text normalization patterns, compiled once per process
+EMDASH = re.compile(r"([\w\d])—([\w\d])")
+WHITESPACE = re.compile(r"\s+")
+PARAGRAPH_BREAK = re.compile(r"\n{2,}")
+
+# Markdown heading lines; [^\S\n] keeps the match from running onto the next line
+HEADING = re.compile(r"^(#{1,6})[^\S\n]+(.*)$", re.M)
+
+# Appended to every paragraph
+PARAGRAPH_PAUSE = ' <break time="250ms"/>'
+
+
+def compile_abbreviations(abbreviations):
+    """Build a single regex matching any abbreviation, longest first."""
+    if not abbreviations:
+        return None
+    keys = sorted(abbreviations, key=len, reverse=True)
+    return re.compile("|".join(re.escape(k) for k in keys))
+
+
 def load_abbreviations(abbr_file):
-    """Load abbreviations from YAML file."""
+    """Load abbreviations from YAML file and compile a pattern for them."""
+    abbreviations = None
     try:
         if pathlib.Path(abbr_file).exists():
             with open(abbr_file, 'r', encoding='utf-8') as f:
-                return yaml.safe_load(f) or {}
+                abbreviations = yaml.safe_load(f) or {}
     except Exception as e:
         print(f"Warning: Could not load abbreviations from {abbr_file}: {e}")
     
-    # Default abbreviations
-    return {"Mr.": "Mister", "Dr.": "Doctor", "e.g.": "for example"}
+    if abbreviations is None:
+        # Default abbreviations
+        abbreviations = {"Mr.": "Mister", "Dr.": "Doctor", "e.g.": "for example"}
+    
+    return abbreviations, compile_abbreviations(abbreviations)
 
 
-def split_into_chunks(paragraphs, max_chars, abbreviations):
+def split_into_chunks(paragraphs, max_chars, abbreviations, pattern=None):
     """Split paragraphs into chunks of specified maximum character length."""
+    if pattern is None:
+        pattern = compile_abbreviations(abbreviations)
+    expand = lambda m: abbreviations[m.group(0)]
+    
     chunk, acc = [], 0
     for para in paragraphs:
         p = para.strip()
         if not p:
             continue
         
-        # Apply abbreviation expansions
-        for k, v in abbreviations.items():
-            p = p.replace(k, v)
+        # Apply abbreviation expansions in a single scan
+        if pattern is not None:
+            p = pattern.sub(expand, p)
         
         # Add pause after paragraph
-        p += " <break time=\"250ms\"/>"
+        piece = f"{p}{PARAGRAPH_PAUSE}"
+        size = len(piece)
         
-        if acc + len(p) > max_chars and chunk:
+        if acc + size > max_chars and chunk:
             yield " ".join(chunk)
-            chunk, acc = [p], len(p)
+            chunk, acc = [piece], size
         else:
-            chunk.append(p)
-            acc += len(p)
+            chunk.append(piece)
+            acc += size
     
     if chunk:
         yield " ".join(chunk)
 
 
-def main():
+def main(argv=None, on_chunk=None):
+    """
+    Run the chunker. If on_chunk is given, it is called with each manifest
+    entry as soon as that chunk file is on disk.
+    """
     p = argparse.ArgumentParser(description="Clean and chunk text for TTS")
     p.add_argument("--md", default="data/work/book.md", help="Input Markdown file")
     p.add_argument("--max_chars", type=int, default=1200, help="Maximum characters per chunk")
     p.add_argument("--out_dir", default="data/work/chunks", help="Output directory for chunks")
     p.add_argument("--abbr", default="resources/abbreviations.yml", help="Abbreviations YAML file")
     p.add_argument("--lexicon", default="resources/lexicon_user.txt", help="User lexicon file")
-    args = p.parse_args()
+    args = p.parse_args(argv)
     
     # Check input file exists
     md_path = pathlib.Path(args.md)
@@ -71,38 +105,40 @@ def main():
     
     # Basic normalizations
     text = text.replace("\u00A0", " ")  # Replace non-breaking spaces
-    text = re.sub(r"([\w\d])—([\w\d])", r"\1 — \2", text)  # Add spaces around em-dashes
-    text = re.sub(r"\s+", " ", text)  # Normalize whitespace
-    
-    # Headings → strong pauses (process line by line to avoid greedy matching)
-    lines = text.split('\n')
-    processed_lines = []
-    for line in lines:
-        # Check if line is a heading
-        if re.match(r'^#{1,6}\s+', line):
-            # Extract heading text without the # symbols
-            heading_text = re.sub(r'^#{1,6}\s+', '', line)
-            processed_lines.append(f'<break time="1200ms"/><emphasis level="strong">{heading_text}</emphasis><break time="800ms"/>')
-        else:
-            processed_lines.append(line)
-    text = '\n'.join(processed_lines)
+    text = EMDASH.sub(r"\1 — \2", text)  # Add spaces around em-dashes
+    text = WHITESPACE.sub(" ", text)  # Normalize whitespace
+    
+    # Headings → strong pauses
+    text = HEADING.sub(
+        r'<break time="1200ms"/><emphasis level="strong">\2</emphasis><break time="800ms"/>',
+        text
+    )
     
     # Split into paragraphs
-    paras = re.split(r"\n{2,}", text)
+    paras = PARAGRAPH_BREAK.split(text)
     
     # Load abbreviations
-    abbreviations = load_abbreviations(args.abbr)
+    abbreviations, abbr_pattern = load_abbreviations(args.abbr)
     
     # Create output directory
     out = pathlib.Path(args.out_dir)
     out.mkdir(parents=True, exist_ok=True)
     
     # Generate chunks
+    chunks = list(split_into_chunks(paras, args.max_chars, abbreviations, abbr_pattern))
+    paths = [out / f"chunk_{i:04d}.txt" for i in range(len(chunks))]
+    
+    def write_chunk(i, fp, ch):
+        fp.write_bytes(ch.encode("utf-8"))
+        return {"idx": i, "text_file": str(fp)}
+    
+    # Write chunk files from a few I/O threads so open/write/close calls overlap
     manifest = []
-    for i, ch in enumerate(split_into_chunks(paras, args.max_chars, abbreviations)):
-        fp = out / f"chunk_{i:04d}.txt"
-        fp.write_text(ch, encoding="utf-8")
-        manifest.append({"idx": i, "text_file": str(fp)})
+    with ThreadPoolExecutor(max_workers=8) as ex:
+        for item in ex.map(write_chunk, range(len(chunks)), paths, chunks):
+            manifest.append(item)
+            if on_chunk:
+                on_chunk(item)
     
     # Write manifest
     manifest_path = pathlib.Path("data/work/manifest.json")
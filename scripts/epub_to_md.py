@@ -1,19 +1,68 @@
 #!/usr/bin/env python3
 """
-EPUB to Markdown conversion script using Calibre's ebook-convert.
+EPUB to Markdown conversion script.
+Converts in-process with ebooklib + markdownify, or with Calibre's ebook-convert.
 """
 
 import argparse
+import re
 import subprocess
 import pathlib
 import sys
 
+# Optional imports - the in-process backend falls back to Calibre without them
+try:
+    import ebooklib
+    from ebooklib import epub
+    from bs4 import BeautifulSoup
+    from markdownify import markdownify
+    HAS_EBOOKLIB = True
+except ImportError:
+    HAS_EBOOKLIB = False
 
-def main():
-    p = argparse.ArgumentParser(description="Convert EPUB to Markdown using Calibre")
+
+# Same chapter rule as the Calibre --chapter XPath below: h1/h2 headings that
+# mention chapter/prologue/epilogue/part become top-level headings
+CHAPTER_HEADING = re.compile(r"^#{1,2}[^\S\n]+(?=.*(?:chapter|prologue|epilogue|part))", re.I | re.M)
+
+
+def convert_with_ebooklib(epub_path, out_path):
+    """Convert EPUB to Markdown in-process, following the spine reading order."""
+    book = epub.read_epub(str(epub_path))
+    
+    parts = []
+    for idref, _ in book.spine:
+        item = book.get_item_with_id(idref)
+        if item is None or item.get_type() != ebooklib.ITEM_DOCUMENT:
+            continue
+        # Only the body is narrated: drop the XML declaration, <head>/<title>
+        # and any inline scripts or styles
+        soup = BeautifulSoup(item.get_content(), "html.parser")
+        body = soup.body or soup
+        for tag in body.find_all(["script", "style"]):
+            tag.decompose()
+        parts.append(markdownify(body.decode_contents(), heading_style="ATX").strip())
+    
+    text = CHAPTER_HEADING.sub("# ", "\n\n".join(parts))
+    out_path.write_text(text, encoding="utf-8")
+
+
+def convert_with_calibre(epub_path, out_path):
+    """Convert EPUB to Markdown with Calibre's ebook-convert."""
+    subprocess.check_call([
+        "ebook-convert", str(epub_path), str(out_path),
+        "--keep-links", "--pretty-print",
+        "--chapter", '//*[(name()="h1" or name()="h2") and re:test(., "chapter|prologue|epilogue|part", "i")]'
+    ])
+
+
+def main(argv=None):
+    p = argparse.ArgumentParser(description="Convert EPUB to Markdown")
     p.add_argument("epub", help="Path to input EPUB file")
     p.add_argument("--out", default="data/work/book.md", help="Output Markdown file path")
-    args = p.parse_args()
+    p.add_argument("--backend", choices=["ebooklib", "calibre"], default="ebooklib",
+                   help="Conversion backend (ebooklib runs in-process, calibre handles edge cases)")
+    args = p.parse_args(argv)
     
     # Ensure input file exists
     epub_path = pathlib.Path(args.epub)
@@ -25,12 +74,16 @@ def main():
     out_path = pathlib.Path(args.out)
     out_path.parent.mkdir(parents=True, exist_ok=True)
     
+    backend = args.backend
+    if backend == "ebooklib" and not HAS_EBOOKLIB:
+        print("Warning: ebooklib/markdownify not installed, falling back to Calibre")
+        backend = "calibre"
+    
     try:
-        subprocess.check_call([
-            "ebook-convert", str(epub_path), str(out_path),
-            "--keep-links", "--pretty-print",
-            "--chapter", '//*[(name()="h1" or name()="h2") and re:test(., "chapter|prologue|epilogue|part", "i")]'
-        ])
+        if backend == "ebooklib":
+            convert_with_ebooklib(epub_path, out_path)
+        else:
+            convert_with_calibre(epub_path, out_path)
         print(f"Wrote {args.out}")
     except subprocess.CalledProcessError as e:
         print(f"Error running ebook-convert: {e}", file=sys.stderr)
@@ -38,7 +91,10 @@ def main():
     except FileNotFoundError:
         print("Error: ebook-convert command not found. Please install Calibre.", file=sys.stderr)
         sys.exit(1)
+    except Exception as e:
+        print(f"Error converting EPUB: {e}", file=sys.stderr)
+        sys.exit(1)
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
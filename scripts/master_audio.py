@@ -3,10 +3,17 @@
 Audio mastering script for loudness normalization and audio processing.
 """
 
+import importlib.util
+import json
+import math
+import os
 import pathlib
 import subprocess
 import sys
+import warnings
+import wave
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 
 
 def run_ffmpeg_command(cmd, description=""):
@@ -23,7 +30,134 @@ def run_ffmpeg_command(cmd, description=""):
     return True
 
 
-def main():
+def measure(wav, args):
+    """Run loudnorm's analysis pass and return its measured values, or None."""
+    cmd = [
+        "ffmpeg", "-hide_banner", "-nostats", "-i", str(wav),
+        "-af", f"loudnorm=I={args.lufs}:TP={args.true_peak}:LRA={args.lra}:print_format=json",
+        "-f", "null", "-"
+    ]
+    try:
+        result = subprocess.run(cmd, capture_output=True, text=True, check=True)
+        # loudnorm prints its JSON summary as the last block on stderr
+        stderr = result.stderr
+        measured = json.loads(stderr[stderr.rindex("{"):stderr.rindex("}") + 1])
+        input_i = float(measured["input_i"])
+    except subprocess.CalledProcessError as e:
+        print(f"Error measuring {wav.name}: {e.stderr}", file=sys.stderr)
+        return None
+    except FileNotFoundError:
+        print("Error: ffmpeg command not found. Please install ffmpeg.", file=sys.stderr)
+        return None
+    except (KeyError, ValueError):
+        print(f"Warning: Could not parse loudness measurement for {wav.name}", file=sys.stderr)
+        return None
+    
+    # Silent input measures as -inf, which linear mode cannot use
+    if not math.isfinite(input_i):
+        return None
+    return measured
+
+
+def wav_sample_rate(wav):
+    """Read a WAV file's sample rate from its header, or None if it can't be parsed."""
+    try:
+        with wave.open(str(wav), "rb") as w:
+            return w.getframerate()
+    except (wave.Error, EOFError, OSError):
+        return None
+
+
+def deesser_filter(args, sample_rate):
+    """Map the CLI de-esser options onto ffmpeg's deesser (frequency normalized to Nyquist)."""
+    freq = min(max(args.deess_freq / (sample_rate / 2), 0.0), 1.0)
+    intensity = min(max(args.deess_threshold, 0.0), 1.0)
+    return f"deesser=i={intensity}:f={freq:.4f}"
+
+
+def loudnorm_filter(args, measured=None):
+    """Build the loudnorm filter, in linear mode when measurements are available."""
+    af = f"loudnorm=I={args.lufs}:TP={args.true_peak}:LRA={args.lra}"
+    if measured:
+        af += (f":measured_I={measured['input_i']}"
+               f":measured_LRA={measured['input_lra']}"
+               f":measured_TP={measured['input_tp']}"
+               f":measured_thresh={measured['input_thresh']}"
+               f":offset={measured['target_offset']}"
+               ":linear=true:print_format=summary")
+    return af
+
+
+def process_one(wav, out_dir, args):
+    """Master a single WAV file. Returns True on success."""
+    print(f"Processing {wav.name}...")
+    out_file = out_dir / wav.name
+    
+    # Two-pass loudness normalization: measure first, then apply a linear gain.
+    # Falls back to single-pass dynamic mode if measurement is unavailable.
+    measured = None if args.single_pass else measure(wav, args)
+    
+    # loudnorm works (and outputs) at 192 kHz; resample back to the input rate
+    af = loudnorm_filter(args, measured)
+    sample_rate = wav_sample_rate(wav)
+    if sample_rate:
+        af += f",aresample={sample_rate}"
+    
+    # De-essing runs in the same filtergraph so each file is encoded only once
+    if args.deess:
+        af += "," + deesser_filter(args, sample_rate or 192000)
+    
+    cmd = ["ffmpeg", "-y", "-i", str(wav), "-af", af, str(out_file)]
+    
+    if not run_ffmpeg_command(cmd, f"mastering {wav.name}"):
+        print(f"Failed to process {wav.name}")
+        return False
+    
+    return True
+
+
+def process_one_python(wav, out_dir, args):
+    """Master a single WAV file in-process with pyloudnorm. Returns True on success."""
+    # Imported here: pyloudnorm pulls in scipy, which the ffmpeg backend never needs
+    import numpy as np
+    import soundfile as sf
+    import pyloudnorm as pyln
+    
+    print(f"Processing {wav.name}...")
+    try:
+        data, rate = sf.read(str(wav), dtype="float32")
+        try:
+            loudness = pyln.Meter(rate).integrated_loudness(data)
+        except ValueError:
+            # Shorter than one 400 ms measurement block
+            loudness = float("-inf")
+        
+        # Silent or too-short audio has no usable loudness; leave it unchanged
+        if math.isfinite(loudness):
+            with warnings.catch_warnings():
+                # pyloudnorm warns about samples over full scale; the peak cap below handles them
+                warnings.simplefilter("ignore", UserWarning)
+                data = pyln.normalize.loudness(data, loudness, args.lufs)
+            
+            # Cap the gain so the (sample) peak stays under --true_peak rather
+            # than hard-clipping; the file may then land below the LUFS target
+            ceiling = 10 ** (args.true_peak / 20)
+            peak = float(np.max(np.abs(data))) if data.size else 0.0
+            if peak > ceiling:
+                data = data * (ceiling / peak)
+        
+        sf.write(str(out_dir / wav.name), data, rate, subtype="PCM_16")
+    except Exception as e:
+        print(f"Failed to process {wav.name}: {e}", file=sys.stderr)
+        return False
+    return True
+
+
+def main(argv=None, wavs=None):
+    """
+    Master every chunk WAV in wav_dir. If wavs is given (e.g. fed from a queue
+    while TTS is still running), files are mastered as they arrive instead.
+    """
     p = argparse.ArgumentParser(description="Master audio files with loudness normalization")
     p.add_argument("--wav_dir", default="data/work/wavs", 
                    help="Input directory containing WAV files")
@@ -38,65 +172,63 @@ def main():
     p.add_argument("--deess", action="store_true", 
                    help="Apply light de-essing")
     p.add_argument("--deess_freq", type=float, default=5500.0, 
-                   help="De-esser frequency")
+                   help="De-esser frequency in Hz")
     p.add_argument("--deess_threshold", type=float, default=0.5, 
-                   help="De-esser threshold")
-    args = p.parse_args()
+                   help="De-esser intensity (0-1)")
+    p.add_argument("--backend", choices=["ffmpeg", "python"], default="ffmpeg",
+                   help="Mastering backend: ffmpeg loudnorm or in-process pyloudnorm")
+    p.add_argument("--single_pass", action="store_true",
+                   help="Skip the loudnorm measurement pass (faster, less accurate)")
+    p.add_argument("--jobs", type=int, default=max(1, (os.cpu_count() or 2) // 2),
+                   help="Number of files to master in parallel")
+    args = p.parse_args(argv)
     
     wav_dir = pathlib.Path(args.wav_dir)
     out_dir = pathlib.Path(args.out_dir)
     
     # Check input directory exists
-    if not wav_dir.exists():
+    if wavs is None and not wav_dir.exists():
         print(f"Error: Input directory '{args.wav_dir}' not found", file=sys.stderr)
         sys.exit(1)
     
+    if args.backend == "python":
+        if any(importlib.util.find_spec(m) is None for m in ("numpy", "soundfile", "pyloudnorm")):
+            print("Error: the python backend requires numpy, soundfile and pyloudnorm. "
+                  "Install with: pip install pyloudnorm", file=sys.stderr)
+            sys.exit(1)
+        if args.deess:
+            print("Warning: --deess is only supported by the ffmpeg backend, skipping de-essing")
+        if args.lra != p.get_default("lra"):
+            print("Warning: --lra is only supported by the ffmpeg backend, ignoring it")
+        print(f"Note: the python backend limits sample peaks to {args.true_peak} dBFS "
+              "instead of true-peak limiting")
+    
     # Create output directory
     out_dir.mkdir(parents=True, exist_ok=True)
     
     # Find WAV files
-    wav_files = sorted(wav_dir.glob("chunk_*.wav"))
-    if not wav_files:
-        print(f"Warning: No chunk_*.wav files found in {args.wav_dir}")
-        return
+    if wavs is None:
+        wav_files = sorted(wav_dir.glob("chunk_*.wav"))
+        if not wav_files:
+            print(f"Warning: No chunk_*.wav files found in {args.wav_dir}")
+            return
+        print(f"Processing {len(wav_files)} audio files...")
+    else:
+        wav_files = (pathlib.Path(wav) for wav in wavs)
     
-    print(f"Processing {len(wav_files)} audio files...")
+    # ffmpeg does the heavy lifting in its own process (and numpy/libsndfile
+    # release the GIL), so threads are enough to keep several files in flight.
+    # Executor.map submits each file as soon as the iterable yields it.
+    worker = process_one_python if args.backend == "python" else process_one
+    with ThreadPoolExecutor(max_workers=args.jobs or os.cpu_count()) as ex:
+        results = list(ex.map(lambda wav: worker(wav, out_dir, args), wav_files))
+    success_count = sum(results)
     
-    success_count = 0
-    for wav in wav_files:
-        print(f"Processing {wav.name}...")
-        out_file = out_dir / wav.name
-        
-        # Build ffmpeg command for loudness normalization
-        cmd = [
-            "ffmpeg", "-y", "-i", str(wav),
-            "-af", f"loudnorm=I={args.lufs}:TP={args.true_peak}:LRA={args.lra}",
-            str(out_file)
-        ]
-        
-        if run_ffmpeg_command(cmd, f"normalizing {wav.name}"):
-            # Apply de-essing if requested
-            if args.deess:
-                temp_file = out_file.with_suffix('.temp.wav')
-                deess_cmd = [
-                    "ffmpeg", "-y", "-i", str(out_file),
-                    "-af", f"deesser=f={args.deess_freq}:t={args.deess_threshold}",
-                    str(temp_file)
-                ]
-                
-                if run_ffmpeg_command(deess_cmd, f"de-essing {wav.name}"):
-                    # Replace original with de-essed version
-                    temp_file.replace(out_file)
-                else:
-                    # Clean up temp file if de-essing failed
-                    if temp_file.exists():
-                        temp_file.unlink()
-            
-            success_count += 1
-        else:
-            print(f"Failed to process {wav.name}")
+    if not results:
+        print("Warning: No audio files to master")
+        return
     
-    print(f"Mastered {success_count}/{len(wav_files)} files → {out_dir}")
+    print(f"Mastered {success_count}/{len(results)} files → {out_dir}")
     
     if success_count == 0:
         print("No files were successfully processed!", file=sys.stderr)
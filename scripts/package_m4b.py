@@ -3,11 +3,16 @@
 Package audio chunks into a chapterized M4B audiobook file.
 """
 
+import io
 import json
+import mmap
+import os
 import pathlib
+import struct
 import subprocess
 import sys
 import argparse
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta
 
 
@@ -23,6 +28,58 @@ def get_audio_duration(wav_file):
         return 0.0
 
 
+# Below this size a plain read() is cheaper than setting up a mapping
+MMAP_MIN_SIZE = 4096
+
+
+def parse_wav_duration(buf, size):
+    """Compute WAV duration from a buffer holding (at least) the RIFF headers."""
+    if size < 12 or buf[:4] != b"RIFF" or buf[8:12] != b"WAVE":
+        return None
+    
+    pos = 12
+    byte_rate = None
+    while pos + 8 <= size:
+        chunk_id, chunk_size = struct.unpack_from('<4sI', buf, pos)
+        pos += 8
+        if chunk_id == b"fmt ":
+            # (format, channels, sample_rate, byte_rate, ...)
+            byte_rate = struct.unpack_from('<HHII', buf, pos)[3]
+        elif chunk_id == b"data":
+            if not byte_rate:
+                return None
+            # Clamp to what is actually on disk (truncated or streamed files)
+            return min(chunk_size, size - pos) / byte_rate
+        # Chunks are word-aligned
+        pos += chunk_size + (chunk_size & 1)
+    return None
+
+
+def wav_duration(wav_file):
+    """
+    Get duration of a PCM/float WAV file from its RIFF header.
+    Returns None if the file is not a WAV this parser understands.
+    """
+    try:
+        with open(wav_file, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size < MMAP_MIN_SIZE:
+                return parse_wav_duration(f.read(), size)
+            # Only the pages holding the headers are ever touched
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                return parse_wav_duration(mm, size)
+    except (OSError, ValueError, struct.error):
+        return None
+
+
+def get_chunk_duration(wav_file):
+    """Get duration of an audio chunk, reading the WAV header when possible."""
+    duration = wav_duration(wav_file)
+    if duration is None:
+        duration = get_audio_duration(wav_file)
+    return duration
+
+
 def format_timestamp(seconds):
     """Format seconds as HH:MM:SS.mmm for chapter timestamps."""
     td = timedelta(seconds=seconds)
@@ -33,32 +90,73 @@ def format_timestamp(seconds):
     return f"{hours:02d}:{minutes:02d}:{seconds:02d}.{milliseconds:03d}"
 
 
-def create_chapters_file(wav_files, output_path):
-    """Create ffmpeg chapters file."""
-    chapters = []
-    current_time = 0.0
-    
-    for i, wav_file in enumerate(wav_files):
-        duration = get_audio_duration(wav_file)
+def create_chapters_file(wav_files, output_path, concat=None):
+    """
+    Create ffmpeg chapters file, streaming each chapter to disk as its
+    duration becomes available. If concat (a binary stream) is given, the
+    concat demuxer list is written to it in the same pass.
+    """
+    concat = concat or io.BytesIO()
+    with open(output_path, 'wb', buffering=1 << 20) as chapters, \
+            ThreadPoolExecutor(max_workers=os.cpu_count()) as ex:
+        chapters.write(b";FFMETADATA1\n"
+                       b"title=Audiobook\n"
+                       b"artist=TTS Generated\n"
+                       b"album=EPUB Conversion\n")
         
-        chapter = f"""[CHAPTER]
+        # Durations come from WAV headers; any file that needs the ffprobe
+        # fallback is probed concurrently with the rest
+        current_time = 0.0
+        durations = ex.map(get_chunk_duration, wav_files)
+        for i, (wav_file, duration) in enumerate(zip(wav_files, durations)):
+            chapter = f"""[CHAPTER]
 TIMEBASE=1/1000
 START={int(current_time * 1000)}
 END={int((current_time + duration) * 1000)}
 title=Chapter {i + 1}
 """
-        chapters.append(chapter)
-        current_time += duration
+            if i:
+                chapters.write(b"\n")
+            chapters.write(chapter.encode('utf-8'))
+            # Explicit file: URLs, since entries would otherwise resolve
+            # relative to the pipe:0 input the list is read from
+            concat.write(f"file 'file:{wav_file.resolve()}'\n".encode('utf-8'))
+            current_time += duration
+
+
+def build_settings(args, output_path, cover_path):
+    """Everything besides the WAVs themselves that determines the M4B contents."""
+    return {
+        "output": str(output_path.resolve()),
+        "bitrate": args.bitrate,
+        "title": args.title,
+        "artist": args.artist,
+        "album": args.album,
+        "cover": str(cover_path.resolve()) if cover_path.exists() else None,
+        "cover_mtime_ns": cover_path.stat().st_mtime_ns if cover_path.exists() else None,
+    }
+
+
+def is_up_to_date(output_path, wav_dir, wav_files, stamp_file, settings):
+    """
+    True if output_path was built by a previous run with the same settings and
+    no WAV has been added, removed or modified since.
+    """
+    try:
+        stamp = json.loads(stamp_file.read_text(encoding="utf-8"))
+        output_mtime = output_path.stat().st_mtime_ns
+    except (OSError, ValueError):
+        return False
+    
+    if stamp.get("settings") != settings or stamp.get("output_mtime_ns") != output_mtime:
+        return False
     
-    with open(output_path, 'w', encoding='utf-8') as f:
-        f.write(";FFMETADATA1\n")
-        f.write("title=Audiobook\n")
-        f.write("artist=TTS Generated\n")
-        f.write("album=EPUB Conversion\n")
-        f.write("\n".join(chapters))
+    # Adding or removing chunks bumps the directory's mtime
+    newest_input = max(wav_dir.stat().st_mtime_ns, *(w.stat().st_mtime_ns for w in wav_files))
+    return newest_input < output_mtime
 
 
-def main():
+def main(argv=None):
     p = argparse.ArgumentParser(description="Package audio into M4B audiobook")
     p.add_argument("--wav_dir", default="data/work/wavs_master", 
                    help="Directory containing mastered WAV files")
@@ -76,7 +174,9 @@ def main():
                    help="Cover image file")
     p.add_argument("--bitrate", default="64k", 
                    help="Audio bitrate for M4B encoding")
-    args = p.parse_args()
+    p.add_argument("--force", action="store_true",
+                   help="Re-encode even if the output is up to date")
+    args = p.parse_args(argv)
     
     wav_dir = pathlib.Path(args.wav_dir)
     
@@ -85,8 +185,11 @@ def main():
         print(f"Error: WAV directory '{args.wav_dir}' not found", file=sys.stderr)
         sys.exit(1)
     
-    # Find WAV files
-    wav_files = sorted(wav_dir.glob("chunk_*.wav"))
+    # Find WAV files; scandir avoids building a Path per directory entry
+    with os.scandir(wav_dir) as it:
+        entries = [e for e in it if e.name.startswith("chunk_") and e.name.endswith(".wav")]
+    entries.sort(key=lambda e: e.name)
+    wav_files = [pathlib.Path(e.path) for e in entries]
     if not wav_files:
         print(f"Error: No chunk_*.wav files found in {args.wav_dir}", file=sys.stderr)
         sys.exit(1)
@@ -98,69 +201,70 @@ def main():
     output_path = pathlib.Path(args.output)
     output_path.parent.mkdir(parents=True, exist_ok=True)
     
-    print(f"Packaging {len(wav_files)} audio files into M4B...")
+    # Skip the encode when nothing has changed since the last build
+    cover_path = pathlib.Path(args.cover)
+    stamp_file = work_dir / f"{output_path.name}.build.json"
+    settings = build_settings(args, output_path, cover_path)
+    if not args.force and is_up_to_date(output_path, wav_dir, wav_files, stamp_file, settings):
+        print(f"{args.output} is up to date, skipping encode (use --force to rebuild)")
+        return
     
-    # Create concat file for ffmpeg
-    concat_file = work_dir / "concat.txt"
-    with open(concat_file, 'w', encoding='utf-8') as f:
-        for wav in wav_files:
-            f.write(f"file '{wav.resolve()}'\n")
+    print(f"Packaging {len(wav_files)} audio files into M4B...")
     
-    # Create chapters metadata file
+    # Create chapters metadata file and the concat list for ffmpeg; the list
+    # is piped to ffmpeg's stdin rather than written to a temp file
+    concat_list = io.BytesIO()
     chapters_file = work_dir / "chapters.txt"
-    create_chapters_file(wav_files, chapters_file)
+    create_chapters_file(wav_files, chapters_file, concat_list)
     
-    # Merge WAVs into single file
-    merged_wav = work_dir / "book_merged.wav"
-    print("Merging audio files...")
-    
-    try:
-        subprocess.check_call([
-            "ffmpeg", "-y", "-f", "concat", "-safe", "0", 
-            "-i", str(concat_file), "-c", "copy", str(merged_wav)
-        ], stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
-    except subprocess.CalledProcessError as e:
-        print(f"Error merging audio files: {e}", file=sys.stderr)
-        sys.exit(1)
-    except FileNotFoundError:
-        print("Error: ffmpeg command not found. Please install ffmpeg.", file=sys.stderr)
-        sys.exit(1)
-    
-    # Convert to M4B with chapters and metadata
-    print("Converting to M4B with chapters...")
+    # Concatenate and encode to M4B with chapters and metadata in one pass,
+    # without writing the merged PCM to disk first
+    print("Encoding M4B with chapters...")
     
     ffmpeg_cmd = [
         "ffmpeg", "-y",
-        "-i", str(merged_wav),
-        "-i", str(chapters_file),
-        "-map_metadata", "1",
+        "-protocol_whitelist", "file,pipe",
+        "-f", "concat", "-safe", "0", "-i", "pipe:0",
+        "-i", str(chapters_file)
+    ]
+    
+    # Add cover art if available (inputs must precede the output options)
+    has_cover = cover_path.exists()
+    if has_cover:
+        ffmpeg_cmd.extend(["-i", str(cover_path)])
+    
+    ffmpeg_cmd.extend(["-map", "0:a", "-map_metadata", "1", "-map_chapters", "1"])
+    if has_cover:
+        ffmpeg_cmd.extend(["-map", "2", "-c:v", "copy", "-disposition:v", "attached_pic"])
+    
+    ffmpeg_cmd.extend([
         "-c:a", "aac",
         "-b:a", args.bitrate,
         "-f", "mp4",
         "-metadata", f"title={args.title}",
         "-metadata", f"artist={args.artist}",
         "-metadata", f"album={args.album}",
-        "-metadata", "genre=Audiobook"
-    ]
-    
-    # Add cover art if available
-    cover_path = pathlib.Path(args.cover)
-    if cover_path.exists():
-        ffmpeg_cmd.extend(["-i", str(cover_path), "-map", "2", "-c:v", "copy", "-disposition:v", "attached_pic"])
-    
-    ffmpeg_cmd.append(str(output_path))
+        "-metadata", "genre=Audiobook",
+        str(output_path)
+    ])
     
     try:
-        subprocess.check_call(ffmpeg_cmd, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+        subprocess.run(ffmpeg_cmd, input=concat_list.getvalue(), check=True,
+                       stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
     except subprocess.CalledProcessError as e:
         print(f"Error creating M4B file: {e}", file=sys.stderr)
         sys.exit(1)
+    except FileNotFoundError:
+        print("Error: ffmpeg command not found. Please install ffmpeg.", file=sys.stderr)
+        sys.exit(1)
     
     # Clean up intermediate files
-    merged_wav.unlink(missing_ok=True)
-    concat_file.unlink(missing_ok=True)
     chapters_file.unlink(missing_ok=True)
     
+    # Record what was built so an unchanged re-run can skip the encode
+    stamp = {"settings": settings, "output_mtime_ns": output_path.stat().st_mtime_ns}
+    stamp_file.write_text(json.dumps(stamp, indent=2), encoding="utf-8")
+    
     print(f"Successfully created M4B audiobook: {args.output}")
     
     # Show file info
@@ -5,11 +5,18 @@ Replace the TODO sections with your chosen local model loaders.
 """
 
 import argparse
+import atexit
+import itertools
 import json
+import multiprocessing as mp
+import os
 import pathlib
+import queue
 import sys
 import re
+import threading
 import numpy as np
+from multiprocessing.connection import Client
 from tqdm import tqdm
 
 # Optional imports - install if using soundfile output
@@ -20,10 +27,47 @@ except ImportError:
     HAS_SOUNDFILE = False
     print("Warning: soundfile not installed. Install with: pip install soundfile")
 
+# Faster manifest parsing when orjson is available
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = orjson.dumps
+except ImportError:
+    _loads = json.loads
+    _dumps = lambda obj: json.dumps(obj).encode()
+
+
+# SSML-ish parser regex: breaks and emphasis handled in a single pass
+TAG = re.compile(r"<break time=\"(\d+)ms\"/>|<emphasis level=\"(\w+)\">(.*?)</emphasis>")
+
+# Unix socket of a long-lived model server (tts_enhanced.serve) for each tier
+SERVER_SOCKET = "data/work/tts-{tier}.sock"
+
+# Synthesis options forwarded to the model server
+SERVER_ARGS = ("tier", "voice", "ref_audio", "rate", "pitch")
 
-# SSML-ish parser regex patterns
-BREAK = re.compile(r"<break time=\"(\d+)ms\"/>")
-EMPH = re.compile(r"<emphasis level=\"(\w+)\">(.*?)</emphasis>")
+# Loaded models, kept across main() calls when the pipeline runs in-process
+_MODELS = {}
+
+# Shared silence buffer, grown geometrically and handed out as read-only views
+_SCRATCH = np.zeros(0, dtype=np.float32)
+
+# Fast-tier worker pools, kept alive across main() calls so each worker
+# loads its model once rather than once per job
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+# Set in a pool worker whose model failed to load (see _init_worker)
+_WORKER_ERROR = None
+
+
+def _get(n):
+    """Return a view of n samples from the shared scratch buffer, growing it if needed."""
+    global _SCRATCH
+    if _SCRATCH.size < n:
+        _SCRATCH = np.zeros(max(n, _SCRATCH.size * 2), dtype=np.float32)
+        _SCRATCH.flags.writeable = False
+    return _SCRATCH[:n]
 
 
 def synthesize_placeholder(text: str, args):
@@ -32,9 +76,16 @@ def synthesize_placeholder(text: str, args):
     Replace this with your actual TTS model implementation.
     """
     # Example: strip tags for basic engines; advanced engines can consume them
-    pauses = [int(ms) for ms in BREAK.findall(text)]
-    plain = BREAK.sub(" ", text)
-    plain = EMPH.sub(lambda m: m.group(2).upper() if m.group(1) == "strong" else m.group(2), plain)
+    pauses = []
+    
+    def replace_tag(m):
+        if m.group(1) is not None:
+            pauses.append(int(m.group(1)))
+            return " "
+        inner = TAG.sub(replace_tag, m.group(3))
+        return inner.upper() if m.group(2) == "strong" else inner
+    
+    plain = TAG.sub(replace_tag, text)
     
     # TODO: Replace this placeholder with actual TTS model synthesis
     # For studio tier:
@@ -45,12 +96,65 @@ def synthesize_placeholder(text: str, args):
     # Generate placeholder audio (silence) - replace with actual TTS output
     duration_seconds = max(1, len(plain) * 0.1)  # Rough estimate
     sample_rate = 24000
-    y = np.zeros(int(duration_seconds * sample_rate), dtype=np.float32)
+    y = _get(int(duration_seconds * sample_rate))
     
     print(f"Generated placeholder audio for text: {plain[:50]}...")
     return y
 
 
+def synthesize_stream(text: str, args, frame_size=24000):
+    """
+    Yield a chunk's audio as float32 frames so it can be written incrementally.
+    Streaming models should yield each vocoded segment directly, e.g.:
+    
+    for segment in model.stream(plain, voice=args.voice):
+        yield segment
+    """
+    # The placeholder has no streaming API, so it slices its finished output
+    y = synthesize_placeholder(text, args)
+    for start in range(0, len(y), frame_size):
+        yield y[start:start + frame_size]
+
+
+def synthesize_batch(texts, args):
+    """
+    Synthesize one batch of up to --batch_size chunks, returning one waveform per text.
+    This is the hook for models with a batched forward pass, e.g.:
+    
+    ys = model.tts_batch(texts, voice=args.voice, ...)  # padded batch + attention mask
+    
+    Batching amortizes per-call launch overhead on GPU models. The placeholder
+    has no batched path, so it synthesizes the chunks one after another.
+    """
+    return [synthesize_placeholder(text, args) for text in texts]
+
+
+def connect_server(address):
+    """Connect to a running model server, or return None to load the model in-process."""
+    if not os.path.exists(address):
+        return None
+    try:
+        return Client(address, family="AF_UNIX")
+    except OSError:
+        return None
+
+
+def synthesize_remote(conn, texts, args):
+    """Synthesize a batch on the model server; same contract as synthesize_batch."""
+    conn.send_bytes(_dumps({"texts": texts, "args": {k: getattr(args, k) for k in SERVER_ARGS}}))
+    reply = _loads(conn.recv_bytes())
+    if not reply["ok"]:
+        raise RuntimeError(reply["error"])
+    return [np.frombuffer(conn.recv_bytes(), dtype=np.float32) for _ in range(reply["count"])]
+
+
+def batched(iterable, n):
+    """Yield lists of up to n items from iterable (itertools.batched on 3.12+)."""
+    it = iter(iterable)
+    while batch := list(itertools.islice(it, n)):
+        yield batch
+
+
 def load_studio_model(model_dir, device="cuda"):
     """
     TODO: Implement studio-quality model loading.
@@ -78,7 +182,173 @@ def load_fast_model(model_dir, device="cpu"):
     return None
 
 
-def main():
+def get_model(tier):
+    """Load the model for a tier once and reuse it on subsequent calls."""
+    if tier not in _MODELS:
+        if tier == "studio":
+            # TODO: load a high-quality GPU model (e.g., XTTS-class / StyleTTS-class)
+            _MODELS[tier] = load_studio_model(model_dir="models/studio", device="cuda")
+        else:
+            # TODO: load a fast CPU model (e.g., Piper-class)
+            _MODELS[tier] = load_fast_model(model_dir="models/fast", device="cpu")
+    return _MODELS[tier]
+
+
+def save_audio(item, frames, out_dir):
+    """
+    Write one chunk's audio frames as they arrive, so only one frame is held
+    in memory. Returns the WAV path, or None for the numpy fallback.
+    """
+    output_file = pathlib.Path(out_dir) / f"chunk_{item['idx']:04d}.wav"
+    
+    if HAS_SOUNDFILE:
+        with sf.SoundFile(str(output_file), 'w', samplerate=24000, channels=1,
+                          subtype='PCM_16') as w:
+            for frame in frames:
+                w.write(frame)
+        return output_file
+    
+    # Fallback: save as numpy array if soundfile not available
+    np.save(str(output_file).replace('.wav', '.npy'), np.concatenate(list(frames)))
+    print(f"Saved as numpy array: {output_file}.npy")
+    return None
+
+
+def _init_worker(tier):
+    """
+    Pool initializer: load the model once per worker process. A failure is
+    recorded rather than raised, since Pool would respawn the worker forever.
+    """
+    global _WORKER_ERROR
+    try:
+        get_model(tier)
+    except Exception as e:
+        _WORKER_ERROR = f"Failed to load {tier} model: {e}"
+
+
+def process_chunk(task):
+    """Read, synthesize and write one (item, args) chunk inside a pool worker."""
+    item, args = task
+    if _WORKER_ERROR:
+        raise RuntimeError(_WORKER_ERROR)
+    try:
+        text_path = pathlib.Path(item["text_file"])
+        if not text_path.exists():
+            print(f"Warning: Text file '{item['text_file']}' not found, skipping")
+            return None
+        text = text_path.read_text(encoding="utf-8")
+        frames = synthesize_stream(text, args)
+        return save_audio(item, frames, args.out_dir)
+    except Exception as e:
+        print(f"Error processing chunk {item['idx']}: {e}")
+        return None
+
+
+def get_pool(tier, jobs):
+    """Return the long-lived worker pool for a tier, starting it on first use."""
+    with _POOLS_LOCK:
+        if (tier, jobs) not in _POOLS:
+            # Forking a multithreaded process (e.g. the web app) can deadlock,
+            # so workers come from a forkserver, or spawn where that's missing
+            method = "forkserver" if "forkserver" in mp.get_all_start_methods() else "spawn"
+            ctx = mp.get_context(method)
+            _POOLS[tier, jobs] = ctx.Pool(jobs, initializer=_init_worker, initargs=(tier,))
+        return _POOLS[tier, jobs]
+
+
+@atexit.register
+def _close_pools():
+    for pool in _POOLS.values():
+        pool.close()
+        pool.join()
+
+
+def run_fast_pool(items, args, on_wav=None):
+    """Fan fast-tier chunks out over CPU worker processes."""
+    pool = get_pool(args.tier, args.jobs)
+    tasks = ((item, args) for item in items)
+    results = pool.imap_unordered(process_chunk, tasks, chunksize=8)
+    try:
+        for output_file in tqdm(results, desc="Generating TTS"):
+            if output_file and on_wav:
+                on_wav(output_file)
+    except Exception:
+        # Don't reuse a pool whose workers can't load the model
+        with _POOLS_LOCK:
+            _POOLS.pop((args.tier, args.jobs), None)
+        pool.terminate()
+        raise
+
+
+def iter_queue(q):
+    """Yield items from a queue until the None sentinel."""
+    while (item := q.get()) is not None:
+        yield item
+
+
+def read_chunks(items, q_in):
+    """Reader thread: load chunk texts and queue (item, text) pairs."""
+    try:
+        for item in tqdm(items, desc="Generating TTS"):
+            try:
+                text_path = pathlib.Path(item["text_file"])
+                if not text_path.exists():
+                    print(f"Warning: Text file '{item['text_file']}' not found, skipping")
+                    continue
+                q_in.put((item, text_path.read_text(encoding="utf-8")))
+            except Exception as e:
+                print(f"Error processing chunk {item['idx']}: {e}")
+    finally:
+        q_in.put(None)
+
+
+def write_chunks(q_out, out_dir, on_wav=None):
+    """Writer thread: save queued (item, audio) pairs as they are synthesized."""
+    for item, audio in iter_queue(q_out):
+        try:
+            output_file = save_audio(item, [audio], out_dir)
+            if output_file and on_wav:
+                on_wav(output_file)
+        except Exception as e:
+            print(f"Error processing chunk {item['idx']}: {e}")
+
+
+def run_pipeline(items, args, synthesize, out_dir, on_wav=None):
+    """Synthesize batches on this thread while reader and writer threads handle disk I/O."""
+    # Bounded queues keep at most a couple of batches in memory on either side
+    q_in = queue.Queue(maxsize=2 * args.batch_size)
+    q_out = queue.Queue(maxsize=2 * args.batch_size)
+    reader = threading.Thread(target=read_chunks, args=(items, q_in), daemon=True)
+    writer = threading.Thread(target=write_chunks, args=(q_out, out_dir, on_wav), daemon=True)
+    reader.start()
+    writer.start()
+    
+    try:
+        for batch in batched(iter_queue(q_in), args.batch_size):
+            batch_items = [item for item, _ in batch]
+            texts = [text for _, text in batch]
+            
+            # Generate audio
+            try:
+                audios = synthesize(texts, args)
+            except Exception as e:
+                idxs = ", ".join(str(item["idx"]) for item in batch_items)
+                print(f"Error processing chunks {idxs}: {e}")
+                continue
+            
+            for item, audio in zip(batch_items, audios):
+                q_out.put((item, audio))
+    finally:
+        q_out.put(None)
+        writer.join()
+
+
+def main(argv=None, items=None, on_wav=None):
+    """
+    Run TTS over the manifest. items may replace the manifest file with any
+    iterable of manifest entries (e.g. fed from a queue while chunking is
+    still running), and on_wav is called with each WAV path once written.
+    """
     p = argparse.ArgumentParser(description="Generate TTS audio from text chunks")
     p.add_argument("--tier", choices=["studio", "fast"], default="studio", 
                    help="TTS quality tier")
@@ -94,63 +364,77 @@ def main():
                    help="Chunk manifest JSON file")
     p.add_argument("--out_dir", default="data/work/wavs", 
                    help="Output directory for WAV files")
-    args = p.parse_args()
+    p.add_argument("--batch_size", type=int, default=16,
+                   help="Chunks handed to synthesize_batch per call (for batched models)")
+    p.add_argument("--jobs", type=int, default=os.cpu_count() or 1,
+                   help="Worker processes for the fast tier (studio stays single-process)")
+    p.add_argument("--server", default=None,
+                   help=f"Model server socket (default: {SERVER_SOCKET.format(tier='<tier>')})")
+    args = p.parse_args(argv)
     
     # Check manifest exists
     manifest_path = pathlib.Path(args.manifest)
-    if not manifest_path.exists():
+    if items is None and not manifest_path.exists():
         print(f"Error: Manifest file '{args.manifest}' not found", file=sys.stderr)
         sys.exit(1)
     
-    # Load model based on tier
-    model = None
-    if args.tier == "studio":
-        # TODO: load a high-quality GPU model (e.g., XTTS-class / StyleTTS-class)
-        model = load_studio_model(model_dir="models/studio", device="cuda")
-        print("Using studio quality TTS (placeholder)")
-    else:
-        # TODO: load a fast CPU model (e.g., Piper-class)
-        model = load_fast_model(model_dir="models/fast", device="cpu")
-        print("Using fast CPU TTS (placeholder)")
-    
     # Load manifest
-    try:
-        manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
-    except json.JSONDecodeError as e:
-        print(f"Error parsing manifest JSON: {e}", file=sys.stderr)
-        sys.exit(1)
+    if items is None:
+        try:
+            items = _loads(manifest_path.read_bytes())
+        except json.JSONDecodeError as e:
+            print(f"Error parsing manifest JSON: {e}", file=sys.stderr)
+            sys.exit(1)
     
     # Create output directory
     out_dir = pathlib.Path(args.out_dir)
     out_dir.mkdir(parents=True, exist_ok=True)
     
-    # Process each chunk
-    for item in tqdm(manifest, desc="Generating TTS"):
+    # Use a running model server if there is one, else load the model here
+    # (pool workers load their own copy, so the pooled path skips it)
+    server_address = args.server or SERVER_SOCKET.format(tier=args.tier)
+    conn = connect_server(server_address)
+    use_pool = conn is None and args.tier == "fast" and args.jobs > 1
+    if conn is not None:
+        print(f"Using TTS server at {server_address}")
+    else:
+        if not use_pool:
+            model = get_model(args.tier)
+        if args.tier == "studio":
+            print("Using studio quality TTS (placeholder)")
+        else:
+            print("Using fast CPU TTS (placeholder)")
+    
+    def synthesize(texts, args):
+        """Synthesize on the server while it answers; fall back to in-process if it goes away."""
+        nonlocal conn
+        if conn is not None:
+            try:
+                return synthesize_remote(conn, texts, args)
+            except (OSError, EOFError) as e:
+                print(f"Warning: lost connection to the TTS server ({e}), continuing in-process")
+                conn.close()
+                conn = None
+                get_model(args.tier)
+        return synthesize_batch(texts, args)
+    
+    # The fast tier is CPU-bound per chunk: spread it over worker processes.
+    # The studio tier stays in this process to avoid GPU contention.
+    if use_pool:
         try:
-            # Read text chunk
-            text_path = pathlib.Path(item["text_file"])
-            if not text_path.exists():
-                print(f"Warning: Text file '{item['text_file']}' not found, skipping")
-                continue
-                
-            txt = text_path.read_text(encoding="utf-8")
-            
-            # Generate audio
-            audio = synthesize_placeholder(txt, args)
-            
-            # Save audio file
-            output_file = out_dir / f"chunk_{item['idx']:04d}.wav"
-            
-            if HAS_SOUNDFILE:
-                sf.write(str(output_file), audio, 24000)
-            else:
-                # Fallback: save as numpy array if soundfile not available
-                np.save(str(output_file).replace('.wav', '.npy'), audio)
-                print(f"Saved as numpy array: {output_file}.npy")
-                
+            run_fast_pool(items, args, on_wav)
         except Exception as e:
-            print(f"Error processing chunk {item['idx']}: {e}")
-            continue
+            print(f"Error: {e}", file=sys.stderr)
+            sys.exit(1)
+        print(f"TTS generation complete. Output in {args.out_dir}")
+        return
+    
+    # Read, synthesize and write overlap: disk I/O runs on its own threads
+    try:
+        run_pipeline(items, args, synthesize, out_dir, on_wav)
+    finally:
+        if conn is not None:
+            conn.close()
     
     print(f"TTS generation complete. Output in {args.out_dir}")
 
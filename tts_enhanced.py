@@ -4,22 +4,101 @@ Enhanced TTS module with Hugging Face integration and voice cloning support.
 """
 
 import os
+import errno
 import json
 import pathlib
 import requests
+import shutil
 import subprocess
+from concurrent.futures import ThreadPoolExecutor
 from typing import Dict, List, Optional, Union
-from huggingface_hub import hf_hub_download, HfApi
+from huggingface_hub import hf_hub_download, snapshot_download, HfApi
 import logging
 
+# soundfile is optional; without it reference audio is only checked for existence
+try:
+    import soundfile as sf
+    HAS_SOUNDFILE = True
+except ImportError:
+    HAS_SOUNDFILE = False
+
+# orjson is optional; fall back to the stdlib with the same output shape
+try:
+    import orjson
+    _loads = orjson.loads
+    _dumps = lambda obj: orjson.dumps(obj, option=orjson.OPT_INDENT_2)
+except ImportError:
+    _loads = json.loads
+    _dumps = lambda obj: json.dumps(obj, indent=2).encode()
+
 logger = logging.getLogger(__name__)
 
+
+def _dir_signature(path: pathlib.Path, metadata_name: str):
+    """
+    mtimes of a directory, its immediate subdirectories and each subdirectory's
+    metadata file, for cache invalidation. The metadata file is included because
+    rewriting it in place does not change any directory mtime.
+    """
+    def mtime(p):
+        try:
+            return os.stat(p).st_mtime_ns
+        except FileNotFoundError:
+            return None
+    
+    try:
+        children = []
+        with os.scandir(path) as it:
+            for entry in it:
+                if entry.is_dir(follow_symlinks=False):
+                    children.append((entry.name, entry.stat(follow_symlinks=False).st_mtime_ns,
+                                     mtime(os.path.join(entry.path, metadata_name))))
+        return path.stat().st_mtime_ns, tuple(sorted(children))
+    except OSError:
+        return None
+
+def _fast_copy(src, dst):
+    """Copy a file in-kernel with copy_file_range (reflinks where supported), then copy metadata"""
+    try:
+        with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+            remaining = os.fstat(fsrc.fileno()).st_size
+            while remaining > 0:
+                copied = os.copy_file_range(fsrc.fileno(), fdst.fileno(), remaining)
+                if copied == 0:
+                    break
+                remaining -= copied
+    except AttributeError:
+        # copy_file_range is Linux-only
+        shutil.copyfile(src, dst)
+    except OSError as e:
+        if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+            raise
+        shutil.copyfile(src, dst)
+    shutil.copystat(src, dst)
+
+def _load_voice_meta(voice_dir: str) -> Optional[Dict]:
+    """Read a voice clone's voice.json; None if missing or unreadable"""
+    metadata_file = os.path.join(voice_dir, "voice.json")
+    if not os.path.exists(metadata_file):
+        return None
+    try:
+        with open(metadata_file, "rb") as f:
+            metadata = _loads(f.read())
+        
+        metadata["id"] = os.path.basename(voice_dir)
+        metadata["path"] = voice_dir
+        return metadata
+    except Exception as e:
+        logger.warning(f"Failed to load voice metadata for {os.path.basename(voice_dir)}: {e}")
+        return None
+
 class ModelManager:
     """Manages TTS model downloads and installation"""
     
     def __init__(self, models_dir: str = "models"):
         self.models_dir = pathlib.Path(models_dir)
         self.models_dir.mkdir(parents=True, exist_ok=True)
+        self._cache = None
         
         # Model registry with popular TTS models
         self.model_registry = {
@@ -67,12 +146,18 @@ class ModelManager:
     
     def list_installed_models(self, tier: str = None) -> Dict:
         """List locally installed models"""
+        signature = tuple(_dir_signature(self.models_dir / t, "metadata.json") for t in ("studio", "fast"))
+        if self._cache is None or self._cache[0] != signature:
+            self._cache = (signature, self._scan_installed_models())
+        installed = self._cache[1]
+        
+        return installed[tier] if tier else installed
+    
+    def _scan_installed_models(self) -> Dict:
+        """Walk the models directory for installed models"""
         installed = {"studio": [], "fast": []}
         
         for model_tier in ["studio", "fast"]:
-            if tier and tier != model_tier:
-                continue
-                
             tier_dir = self.models_dir / model_tier
             if tier_dir.exists():
                 for model_dir in tier_dir.iterdir():
@@ -85,7 +170,7 @@ class ModelManager:
                             "files": list(f.name for f in model_dir.iterdir() if f.is_file())
                         })
         
-        return installed[tier] if tier else installed
+        return installed
     
     def download_model(self, model_name: str, tier: str, progress_callback=None) -> bool:
         """Download a model from Hugging Face"""
@@ -99,21 +184,33 @@ class ModelManager:
             
             logger.info(f"Downloading {model_name} to {local_dir}")
             
-            # Download required files
-            for file_name in model_info["files"]:
-                if progress_callback:
-                    progress_callback(f"Downloading {file_name}...")
-                
-                try:
-                    downloaded_file = hf_hub_download(
-                        repo_id=model_name,
-                        filename=file_name,
-                        local_dir=local_dir,
-                        local_dir_use_symlinks=False
-                    )
-                    logger.info(f"Downloaded {file_name}")
-                except Exception as e:
-                    logger.warning(f"Failed to download {file_name}: {e}")
+            # Download required files in parallel through the hub cache
+            if progress_callback:
+                progress_callback(f"Downloading {', '.join(model_info['files'])}...")
+            
+            try:
+                snapshot_download(
+                    repo_id=model_name,
+                    allow_patterns=model_info["files"],
+                    local_dir=local_dir,
+                    max_workers=8
+                )
+                logger.info(f"Downloaded {len(model_info['files'])} files")
+            except Exception as e:
+                logger.warning(f"Snapshot download failed, fetching files one by one: {e}")
+                for file_name in model_info["files"]:
+                    if progress_callback:
+                        progress_callback(f"Downloading {file_name}...")
+                    
+                    try:
+                        hf_hub_download(
+                            repo_id=model_name,
+                            filename=file_name,
+                            local_dir=local_dir
+                        )
+                        logger.info(f"Downloaded {file_name}")
+                    except Exception as e:
+                        logger.warning(f"Failed to download {file_name}: {e}")
             
             # Save model metadata
             metadata = {
@@ -125,8 +222,9 @@ class ModelManager:
                 "size_gb": model_info["size_gb"]
             }
             
-            with open(local_dir / "metadata.json", "w") as f:
-                json.dump(metadata, f, indent=2)
+            with open(local_dir / "metadata.json", "wb") as f:
+                f.write(_dumps(metadata))
+            self._cache = None
             
             if progress_callback:
                 progress_callback("Download complete!")
@@ -146,6 +244,7 @@ class ModelManager:
             if model_dir.exists():
                 import shutil
                 shutil.rmtree(model_dir)
+                self._cache = None
                 logger.info(f"Removed model {model_name}")
                 return True
             else:
@@ -184,18 +283,29 @@ class ModelManager:
     def _get_folder_size(self, folder_path: pathlib.Path) -> int:
         """Get total size of folder in bytes"""
         total_size = 0
-        for file_path in folder_path.rglob('*'):
-            if file_path.is_file():
-                total_size += file_path.stat().st_size
+        stack = [folder_path]
+        while stack:
+            with os.scandir(stack.pop()) as it:
+                for entry in it:
+                    if entry.is_file(follow_symlinks=False):
+                        total_size += entry.stat(follow_symlinks=False).st_size
+                    elif entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
         return total_size
 
 
 class VoiceCloner:
     """Handles voice cloning functionality"""
     
+    # Reference audio requirements for cloning
+    SAMPLE_RATES = (22050, 44100, 48000)
+    MIN_SECONDS = 5
+    MAX_SECONDS = 60
+    
     def __init__(self, voices_dir: str = "data/voices"):
         self.voices_dir = pathlib.Path(voices_dir)
         self.voices_dir.mkdir(parents=True, exist_ok=True)
+        self._cache = None
     
     def create_voice_clone(self, audio_path: str, voice_name: str, 
                           language: str = "en", gender: str = "neutral",
@@ -206,8 +316,9 @@ class VoiceCloner:
                 progress_callback("Analyzing audio sample...")
             
             # Validate audio file
-            if not self._validate_audio(audio_path):
-                raise ValueError("Invalid audio file")
+            problem = self._audio_problem(audio_path)
+            if problem:
+                raise ValueError(f"Invalid audio file: {problem}")
             
             voice_dir = self.voices_dir / voice_name.replace(" ", "_").lower()
             voice_dir.mkdir(parents=True, exist_ok=True)
@@ -222,8 +333,7 @@ class VoiceCloner:
             # 4. Save the voice model
             
             # For demo, just copy the audio and create metadata
-            import shutil
-            shutil.copy2(audio_path, voice_dir / "reference.wav")
+            _fast_copy(audio_path, voice_dir / "reference.wav")
             
             if progress_callback:
                 progress_callback("Training voice model...")
@@ -239,8 +349,9 @@ class VoiceCloner:
                 "status": "ready"
             }
             
-            with open(voice_dir / "voice.json", "w") as f:
-                json.dump(metadata, f, indent=2)
+            with open(voice_dir / "voice.json", "wb") as f:
+                f.write(_dumps(metadata))
+            self._cache = None
             
             if progress_callback:
                 progress_callback("Voice clone created successfully!")
@@ -256,23 +367,21 @@ class VoiceCloner:
     
     def list_voice_clones(self) -> List[Dict]:
         """List available voice clones"""
-        voices = []
+        signature = _dir_signature(self.voices_dir, "voice.json")
+        if self._cache is None or self._cache[0] != signature:
+            self._cache = (signature, self._scan_voice_clones())
+        return self._cache[1]
+    
+    def _scan_voice_clones(self) -> List[Dict]:
+        """Read metadata for every voice clone directory"""
+        with os.scandir(self.voices_dir) as it:
+            voice_dirs = [entry.path for entry in it if entry.is_dir()]
         
-        for voice_dir in self.voices_dir.iterdir():
-            if voice_dir.is_dir():
-                metadata_file = voice_dir / "voice.json"
-                if metadata_file.exists():
-                    try:
-                        with open(metadata_file) as f:
-                            metadata = json.load(f)
-                        
-                        metadata["id"] = voice_dir.name
-                        metadata["path"] = str(voice_dir)
-                        voices.append(metadata)
-                    except Exception as e:
-                        logger.warning(f"Failed to load voice metadata for {voice_dir.name}: {e}")
+        # Metadata files are small and many: overlap their reads
+        with ThreadPoolExecutor(max_workers=8) as pool:
+            voices = list(pool.map(_load_voice_meta, voice_dirs))
         
-        return voices
+        return [voice for voice in voices if voice is not None]
     
     def remove_voice_clone(self, voice_id: str) -> bool:
         """Remove a voice clone"""
@@ -281,6 +390,7 @@ class VoiceCloner:
             if voice_dir.exists():
                 import shutil
                 shutil.rmtree(voice_dir)
+                self._cache = None
                 logger.info(f"Removed voice clone: {voice_id}")
                 return True
             else:
@@ -292,22 +402,42 @@ class VoiceCloner:
     
     def _validate_audio(self, audio_path: str) -> bool:
         """Validate audio file for voice cloning"""
+        return self._audio_problem(audio_path) is None
+    
+    def _audio_problem(self, audio_path: str) -> Optional[str]:
+        """Describe why an audio file can't be used for cloning, or None if it can"""
         try:
             # Check if file exists
             if not pathlib.Path(audio_path).exists():
-                return False
-            
-            # In a real implementation, this would:
-            # 1. Check audio format (WAV, MP3, etc.)
-            # 2. Validate sample rate (prefer 22050 or 44100 Hz)
-            # 3. Check duration (5-60 seconds recommended)
-            # 4. Validate audio quality (SNR, etc.)
-            
-            return True
+                return "Audio file not found"
+            
+            if not HAS_SOUNDFILE:
+                return None
+            
+            # Header-only read: cost does not depend on the audio length
+            try:
+                info = sf.info(audio_path)
+            except RuntimeError as e:
+                # Containers libsndfile can't open (M4A, MP3 on older builds)
+                # are accepted unchecked
+                logger.info(f"Skipping format checks for {audio_path}: {e}")
+                return None
+            
+            if info.samplerate not in self.SAMPLE_RATES:
+                rates = ", ".join(str(rate) for rate in self.SAMPLE_RATES)
+                return f"Sample rate {info.samplerate} Hz is not supported (use {rates} Hz)"
+            
+            duration = info.frames / info.samplerate
+            if not self.MIN_SECONDS <= duration <= self.MAX_SECONDS:
+                return (f"Audio is {duration:.1f}s long, expected "
+                        f"{self.MIN_SECONDS}-{self.MAX_SECONDS}s")
+            
+            # Audio quality (SNR, etc.) is not checked yet
+            return None
             
         except Exception as e:
             logger.error(f"Audio validation failed: {e}")
-            return False
+            return f"Audio validation failed: {e}"
 
 
 class EnhancedTTSEngine:
@@ -392,7 +522,70 @@ class EnhancedTTSEngine:
         return default_voices
 
 
+def _serve_client(conn, synthesize_batch):
+    """Answer batch synthesis requests from one client until it disconnects"""
+    import numpy as np
+    from types import SimpleNamespace
+    
+    while True:
+        try:
+            request = _loads(conn.recv_bytes())
+        except EOFError:
+            return
+        
+        try:
+            audios = synthesize_batch(request["texts"], SimpleNamespace(**request["args"]))
+        except Exception as e:
+            logger.error(f"Synthesis failed: {e}")
+            conn.send_bytes(_dumps({"ok": False, "error": str(e)}))
+            continue
+        
+        conn.send_bytes(_dumps({"ok": True, "count": len(audios)}))
+        for audio in audios:
+            conn.send_bytes(np.asarray(audio, dtype=np.float32).tobytes())
+
+def serve(tier: str = "studio", address: str = None):
+    """Load a tier's model once and serve tts_generate.py clients over a Unix socket"""
+    from multiprocessing.connection import Listener
+    from scripts import tts_generate
+    
+    address = address or tts_generate.SERVER_SOCKET.format(tier=tier)
+    pathlib.Path(address).parent.mkdir(parents=True, exist_ok=True)
+    if os.path.exists(address):
+        # Left behind by a server that did not shut down cleanly
+        os.unlink(address)
+    
+    tts_generate.get_model(tier)
+    logger.info(f"Serving {tier} TTS model on {address}")
+    
+    # Requests are JSON and audio is raw float32, framed by the connection (no pickling)
+    with Listener(address, family="AF_UNIX") as listener:
+        while True:
+            # A client that disconnects mid-reply or sends a malformed request
+            # only loses its own connection; the server keeps accepting
+            try:
+                with listener.accept() as conn:
+                    _serve_client(conn, tts_generate.synthesize_batch)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Dropped TTS client connection: {e}")
+
+
 # Global instances
 model_manager = ModelManager()
 voice_cloner = VoiceCloner()
-tts_engine = EnhancedTTSEngine()
\ No newline at end of file
+tts_engine = EnhancedTTSEngine()
+
+
+if __name__ == "__main__":
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Keep a TTS model loaded for tts_generate.py")
+    parser.add_argument("--tier", choices=["studio", "fast"], default="studio", help="Model tier to serve")
+    parser.add_argument("--socket", default=None, help="Unix socket path (default: data/work/tts-<tier>.sock)")
+    args = parser.parse_args()
+    
+    logging.basicConfig(level=logging.INFO)
+    try:
+        serve(args.tier, args.socket)
+    except KeyboardInterrupt:
+        pass